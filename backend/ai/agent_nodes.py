@@ -1,6 +1,10 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List, Literal
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Literal, Sequence, Tuple
 from openai import OpenAI
 from pathlib import Path
 from .states import IkeaState
@@ -10,11 +14,27 @@ from .helpers import _image_to_base64
 # ---------
 # CONFIG
 # ---------
-TEXT_MODEL = "gpt-4o"
-VISION_MODEL = "gpt-4o"
+# Overridable via env so the pipeline can be pointed at a local
+# OpenAI-compatible server (vLLM/Ollama) serving a quantized model tag
+# (e.g. a W8A8/Q4 VL build) without touching code. The base URL is picked
+# up by the OpenAI client itself through OPENAI_BASE_URL.
+TEXT_MODEL = os.getenv("IKEA_TEXT_MODEL", "gpt-4o")
+VISION_MODEL = os.getenv("IKEA_VISION_MODEL", "gpt-4o")
 
 client = OpenAI()
 
+# Prompts are kept byte-identical across calls (static text in module-level
+# constants, dynamic values only appended at the end) so an OpenAI-compatible
+# server with prefix caching can reuse the prefill across steps and runs.
+SYSTEM_PROMPT = "You are running a 2-agent IKEA step analysis pipeline."
+
+ANALYST_PROMPT_PREFIX = (
+    "You are a visual analyst for IKEA assembly instructions.\n"
+    "Look at the provided step image and extract a structured description.\n"
+    "Return STRICT JSON only (no markdown) with keys:\n"
+    "step_id, action_summary, objects, fasteners, quantities, warnings, dependencies, confidence.\n"
+)
+
 # -------------------------
 # LLM wrappers (replace these)
 # -------------------------
@@ -31,13 +51,66 @@ def call_llm_text(messages: List[Dict[str, str]]) -> str:
     )
     return response.choices[0].message.content
 
+# -------------------------
+# Vision response cache
+# -------------------------
+# Many IKEA manuals share identical step panels (same PDF re-uploaded, or the
+# same hardware page across products). Responses are cached on disk keyed by
+# the image content + prompt, so a repeated panel costs one hash + file read
+# instead of a model call. Exact content hashing is used (no perceptual-hash /
+# embedding dependencies in this tree); identical crops are the common case
+# because crops themselves are cached by pdf_hash upstream.
+
+VISION_CACHE_DIR = Path(os.getenv("IKEA_VISION_CACHE_DIR", "./artifacts/vision_cache"))
+
+
+def _vision_cache_path(prompt: str, image_b64: str) -> Path:
+    h = hashlib.sha256()
+    h.update(VISION_MODEL.encode("utf-8"))
+    h.update(b"\x00")
+    h.update(prompt.encode("utf-8"))
+    h.update(b"\x00")
+    h.update(image_b64.encode("ascii"))
+    return VISION_CACHE_DIR / f"{h.hexdigest()}.json"
+
+
+def _vision_cache_get(path: Path) -> str | None:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("response")
+    except (OSError, ValueError):
+        return None
+
+
+def _vision_cache_put(path: Path, prompt: str, response: str) -> None:
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = Path(str(path) + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"model": VISION_MODEL, "prompt": prompt, "response": response}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    except OSError:
+        # cache is best-effort; never fail the pipeline over it
+        pass
+
+
 def call_llm_vision(prompt: str, image_path: str | Path) -> str:
     """
     prompt: instruction text
     image_path: local cropped step image
     returns: assistant text (ideally JSON)
+
+    Responses are cached under VISION_CACHE_DIR keyed by (model, prompt, image
+    content), so re-running a manual or hitting a shared panel skips the call.
     """
     image_b64 = _image_to_base64(image_path)
+    suffix = Path(image_path).suffix.lower()
+    mime = "image/jpeg" if suffix in (".jpg", ".jpeg") else "image/png"
+
+    cache_path = _vision_cache_path(prompt, image_b64)
+    cached = _vision_cache_get(cache_path)
+    if cached is not None:
+        return cached
 
     response = client.chat.completions.create(
         model=VISION_MODEL,
@@ -49,7 +122,7 @@ def call_llm_vision(prompt: str, image_path: str | Path) -> str:
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:image/png;base64,{image_b64}"
+                            "url": f"data:{mime};base64,{image_b64}"
                         },
                     },
                 ],
@@ -58,7 +131,38 @@ def call_llm_vision(prompt: str, image_path: str | Path) -> str:
         temperature=0.2,
     )
 
-    return response.choices[0].message.content
+    text = response.choices[0].message.content
+    _vision_cache_put(cache_path, prompt, text)
+    return text
+
+
+def call_llm_vision_many(
+    jobs: Sequence[Tuple[str, str | Path]],
+    max_workers: int | None = None,
+) -> List[str]:
+    """
+    Fan out several independent vision calls concurrently.
+
+    jobs: [(prompt, image_path), ...] — each pair is one call_llm_vision request.
+    returns: assistant texts, aligned with the input order.
+
+    Wall time per step is dominated by the HTTP round-trip to the model server,
+    so overlapping the requests with threads (the OpenAI client is thread-safe)
+    gives a near-linear speedup without changing any call semantics.
+    """
+    if not jobs:
+        return []
+    if len(jobs) == 1:
+        prompt, image_path = jobs[0]
+        return [call_llm_vision(prompt=prompt, image_path=image_path)]
+
+    workers = max_workers or min(len(jobs), (os.cpu_count() or 4) * 2)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(call_llm_vision, prompt=prompt, image_path=image_path)
+            for prompt, image_path in jobs
+        ]
+        return [f.result() for f in futures]
 
 
 # -------------------------
@@ -82,7 +186,7 @@ def init_agent_state(state: IkeaState) -> Dict[str, Any]:
         "current_step": 0,
         "step_analyses": [],
         "messages": [
-            {"role": "system", "content": "You are running a 2-agent IKEA step analysis pipeline."}
+            {"role": "system", "content": SYSTEM_PROMPT}
         ],
     }
 
@@ -92,18 +196,21 @@ def instructor_agent(state: IkeaState) -> Dict[str, Any]:
     i = int(state.get("current_step", 0))
 
     # If done: assemble final output
+    # "messages" is an additive channel: return only the new messages and
+    # LangGraph appends them, instead of copying the whole history per step.
     if i >= len(steps):
-        messages = list(state.get("messages", []))
         step_analyses = state.get("step_analyses", [])
 
-        messages.append({"role": "user", "content": "All steps are analyzed. Create final ordered assembly instructions as JSON."})
-        messages.append({"role": "user", "content": f"Per-step analyses:\n{step_analyses}"})
+        new_messages = [
+            {"role": "user", "content": "All steps are analyzed. Create final ordered assembly instructions as JSON."},
+            {"role": "user", "content": f"Per-step analyses:\n{step_analyses}"},
+        ]
 
-        final_text = call_llm_text(messages)
-        messages.append({"role": "assistant", "content": final_text})
+        final_text = call_llm_text(list(state.get("messages", [])) + new_messages)
+        new_messages.append({"role": "assistant", "content": final_text})
 
         return {
-            "messages": messages,
+            "messages": new_messages,
             "final_instructions": {"raw": final_text},
         }
 
@@ -111,15 +218,14 @@ def instructor_agent(state: IkeaState) -> Dict[str, Any]:
     step = steps[i]
     step_id = step["step_id"]
 
-    messages = list(state.get("messages", []))
-    messages.append({
+    new_messages = [{
         "role": "user",
         "content": (
             f"Analyze next step index={i} step_id={step_id}. "
             "Return STRICT JSON only with keys: "
             "step_id, action_summary, objects, fasteners, quantities, warnings, dependencies, confidence."
         ),
-    })
+    }]
 
     print(
     "[INSTRUCTOR]",
@@ -128,9 +234,15 @@ def instructor_agent(state: IkeaState) -> Dict[str, Any]:
     "has_final =", "final_instructions" in state,
     )
 
-    return {"messages": messages}
+    return {"messages": new_messages}
+
 
 
+def _analyst_prompt(step_id: str) -> str:
+    # Static prefix first, dynamic step_id last: keeps the shared prefix
+    # cacheable on the server side.
+    return ANALYST_PROMPT_PREFIX + f"step_id must be '{step_id}'."
+
 
 def step_analyst_agent(state: IkeaState) -> Dict[str, Any]:
     steps = _get_steps(state)
@@ -138,37 +250,32 @@ def step_analyst_agent(state: IkeaState) -> Dict[str, Any]:
     if i >= len(steps):
         return {}
 
-    step = steps[i]
-    step_id = step["step_id"]
-    image_path = step["image_path"]
-
-    prompt = (
-        "You are a visual analyst for IKEA assembly instructions.\n"
-        "Look at the provided step image and extract a structured description.\n"
-        "Return STRICT JSON only (no markdown) with keys:\n"
-        "step_id, action_summary, objects, fasteners, quantities, warnings, dependencies, confidence.\n"
-        f"step_id must be '{step_id}'."
-    )
-
-    analyst_json = call_llm_vision(prompt=prompt, image_path=image_path)
+    # Each step only needs its own crop, so all remaining analyses are
+    # independent: fire them as one concurrent batch instead of one request
+    # per instructor round-trip. Results are processed in step order.
+    pending = steps[i:]
+    jobs = [(_analyst_prompt(s["step_id"]), s["image_path"]) for s in pending]
+    analyst_outputs = call_llm_vision_many(jobs)
 
     step_analyses = list(state.get("step_analyses", []))
-    step_analyses.append({
-        "step_id": step_id,
-        "global_step_index": step.get("global_step_index"),
-        "page_index": step.get("page_index"),
-        "panel_index": step.get("panel_index"),
-        "image_path": image_path,
-        "analysis_raw": analyst_json,
-    })
-
-    messages = list(state.get("messages", []))
-    messages.append({"role": "assistant", "content": f"Step analyst output for {step_id}: {analyst_json}"})
+    new_messages: List[Dict[str, str]] = []
+
+    for step, analyst_json in zip(pending, analyst_outputs):
+        step_id = step["step_id"]
+        step_analyses.append({
+            "step_id": step_id,
+            "global_step_index": step.get("global_step_index"),
+            "page_index": step.get("page_index"),
+            "panel_index": step.get("panel_index"),
+            "image_path": step["image_path"],
+            "analysis_raw": analyst_json,
+        })
+        new_messages.append({"role": "assistant", "content": f"Step analyst output for {step_id}: {analyst_json}"})
 
     return {
         "step_analyses": step_analyses,
-        "messages": messages,
-        "current_step": i + 1,
+        "messages": new_messages,
+        "current_step": len(steps),
     }
 
 
@@ -1,4 +1,5 @@
 from pathlib import Path
+import os
 import shutil
 
 ARTIFACTS_ROOT = Path(r"\artifacts\pdf_pages")
@@ -7,6 +8,21 @@ DATASET_IMAGES = Path(r"dataset\images")
 DATASET_IMAGES.mkdir(parents=True, exist_ok=True)
 
 
+def link_or_copy(src: Path, dst: Path) -> None:
+    """
+    Hard-link src to dst (metadata-only, zero bytes copied); fall back to a
+    real copy when linking isn't possible (cross-device, FAT, etc.).
+    Raises FileExistsError if dst already exists.
+    """
+    try:
+        os.link(src, dst)
+    except FileExistsError:
+        raise
+    except OSError:
+        with open(src, "rb") as fsrc, open(dst, "xb") as fdst:
+            shutil.copyfileobj(fsrc, fdst)
+
+
 def copy_pages_to_dataset(
     class_name: str,
     product_name: str,
@@ -18,15 +34,24 @@ def copy_pages_to_dataset(
 
     pdf_hash_short = cache_key.split(":")[0][:6]
 
-    for img_path in sorted(src_dir.glob("page_*.png")):
-        new_name = f"{class_name}__{product_name}__{pdf_hash_short}__{img_path.name}"
+    # os.scandir yields dirents without the per-entry stat that glob pays.
+    entries = [
+        e for e in os.scandir(src_dir)
+        if e.name.startswith("page_") and e.name.endswith(".png")
+    ]
+    entries.sort(key=lambda e: e.name)
+
+    for entry in entries:
+        new_name = f"{class_name}__{product_name}__{pdf_hash_short}__{entry.name}"
         dst_path = DATASET_IMAGES / new_name
 
-        if dst_path.exists():
+        # Hard-link into the dataset (instant, no bytes copied); collisions
+        # still surface as FileExistsError.
+        try:
+            link_or_copy(Path(entry.path), dst_path)
+        except FileExistsError:
             raise RuntimeError(f"Collision detected: {dst_path}")
 
-        shutil.copy2(img_path, dst_path)
-
 
 # -----------------------------
 # Example usage
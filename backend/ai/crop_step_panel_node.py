@@ -1,75 +1,94 @@
 from __future__ import annotations
 
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 import json
 import os
 
+import numpy as np
 from PIL import Image
 
+try:
+    import orjson  # ~5x faster manifest encode/decode than stdlib json
+except ImportError:
+    orjson = None
+
 NMS_IOU = 0.6
 
-def _area_xyxy(b: List[float]) -> float:
-    x1, y1, x2, y2 = map(float, b)
-    return max(0.0, x2 - x1) * max(0.0, y2 - y1)
-
-def _iou_xyxy(a: List[float], b: List[float]) -> float:
-    ax1, ay1, ax2, ay2 = map(float, a)
-    bx1, by1, bx2, by2 = map(float, b)
-
-    ix1 = max(ax1, bx1)
-    iy1 = max(ay1, by1)
-    ix2 = min(ax2, bx2)
-    iy2 = min(ay2, by2)
-
-    iw = max(0.0, ix2 - ix1)
-    ih = max(0.0, iy2 - iy1)
-    inter = iw * ih
-    if inter <= 0.0:
-        return 0.0
-
-    union = _area_xyxy(a) + _area_xyxy(b) - inter
-    if union <= 0.0:
-        return 0.0
-    return inter / union
-
-def _nms_dedup_xyxy(
-    dets: List[Dict[str, Any]],
-    iou_thresh: float = 0.85,
-) -> List[Dict[str, Any]]:
+def _soa_from_detections(dets: Any) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Normalize one page's detections into SoA arrays (bboxes, confidences,
+    class ids). Accepts the SoA page record emitted by DetectStepPanelsNode
+    ({"bbox_xyxy": (N,4), "confidence": (N,), "class_id": (N,)}) as well as
+    the legacy list-of-dicts format.
+    """
+    if isinstance(dets, dict):
+        bboxes = np.asarray(dets.get("bbox_xyxy", []), dtype=np.float32).reshape(-1, 4)
+        confs = np.asarray(dets.get("confidence", []), dtype=np.float32).reshape(-1)
+        clss = np.asarray(dets.get("class_id", []), dtype=np.int64).reshape(-1)
+    else:
+        valid = [
+            d for d in (dets or [])
+            if isinstance(d.get("bbox_xyxy"), (list, tuple)) and len(d["bbox_xyxy"]) == 4
+        ]
+        bboxes = np.asarray([d["bbox_xyxy"] for d in valid], dtype=np.float32).reshape(-1, 4)
+        confs = np.asarray([float(d.get("confidence", 0.0)) for d in valid], dtype=np.float32)
+        clss = np.asarray([int(d.get("class_id", 0)) for d in valid], dtype=np.int64)
+
+    n = bboxes.shape[0]
+    if confs.shape[0] != n:
+        confs = np.zeros(n, dtype=np.float32)
+    if clss.shape[0] != n:
+        clss = np.zeros(n, dtype=np.int64)
+    return bboxes, confs, clss
+
+
+def _nms_keep_indices(bboxes: np.ndarray, confs: np.ndarray, iou_thresh: float) -> np.ndarray:
     """
-    Simple NMS: keeps highest-confidence boxes, removes boxes with IoU > threshold.
-    Expects each det to have: det["bbox_xyxy"] and optionally det["confidence"].
+    Greedy NMS on SoA arrays: keeps highest-confidence boxes, drops boxes
+    with IoU > threshold against an already-kept box. Returns kept indices.
     """
-    # keep only valid boxes
-    valid: List[Dict[str, Any]] = []
-    for d in dets:
-        bb = d.get("bbox_xyxy")
-        if isinstance(bb, list) and len(bb) == 4:
-            valid.append(d)
-
-    # sort by confidence descending (missing -> 0.0)
-    valid.sort(key=lambda d: float(d.get("confidence", 0.0)), reverse=True)
-
-    kept: List[Dict[str, Any]] = []
-    for d in valid:
-        bb = d["bbox_xyxy"]
-        is_dup = False
-        for k in kept:
-            if _iou_xyxy(bb, k["bbox_xyxy"]) > iou_thresh:
-                is_dup = True
-                break
-        if not is_dup:
-            kept.append(d)
-
-    return kept
+    if bboxes.shape[0] == 0:
+        return np.empty(0, dtype=np.int64)
+
+    x1, y1, x2, y2 = bboxes[:, 0], bboxes[:, 1], bboxes[:, 2], bboxes[:, 3]
+    areas = np.maximum(0.0, x2 - x1) * np.maximum(0.0, y2 - y1)
+    order = np.argsort(-confs, kind="stable")
+
+    kept: List[int] = []
+    while order.size:
+        i = int(order[0])
+        kept.append(i)
+        rest = order[1:]
+        if rest.size == 0:
+            break
+
+        ix1 = np.maximum(x1[i], x1[rest])
+        iy1 = np.maximum(y1[i], y1[rest])
+        ix2 = np.minimum(x2[i], x2[rest])
+        iy2 = np.minimum(y2[i], y2[rest])
+        inter = np.maximum(0.0, ix2 - ix1) * np.maximum(0.0, iy2 - iy1)
+        union = areas[i] + areas[rest] - inter
+        iou = np.where(union > 0.0, inter / union, 0.0)
+
+        order = rest[iou <= iou_thresh]
+
+    return np.asarray(kept, dtype=np.int64)
 
 
 def _clamp(v: float, lo: float, hi: float) -> float:
     return max(lo, min(v, hi))
 
 
+def _save_crop(crop: Image.Image, out_path: Path, image_format: str, jpeg_quality: int) -> None:
+    if image_format == "jpg":
+        crop.save(out_path, "JPEG", quality=jpeg_quality)
+    else:
+        crop.save(out_path)
+
+
 def _safe_name(s: str) -> str:
     return "".join(ch if ch.isalnum() or ch in "-_." else "_" for ch in s)
 
@@ -110,6 +129,10 @@ class CropStepPanelsNode:
     cache_policy: str = "use_cache"  # "use_cache" | "refresh"
     steps_subdir: str = "step_crops"
     manifest_name: str = "manifest.json"
+    # JPEG by default: IKEA line-art crops compress to a fraction of PNG size,
+    # which shrinks both disk I/O and the base64 payload sent to the VL model.
+    image_format: str = "jpg"  # "jpg" | "png"
+    jpeg_quality: int = 85
 
     def __call__(self, state: Dict[str, Any]) -> Dict[str, Any]:
         pdf_render = state.get("pdf_render")
@@ -129,6 +152,10 @@ class CropStepPanelsNode:
         padding_px = int(cfg.get("padding_px", self.padding_px))
         min_box_size_px = int(cfg.get("min_box_size_px", self.min_box_size_px))
         cache_policy = cfg.get("cache_policy", self.cache_policy)
+        image_format = cfg.get("image_format", self.image_format)
+        jpeg_quality = int(cfg.get("jpeg_quality", self.jpeg_quality))
+        if image_format not in ("jpg", "png"):
+            raise ValueError(f"Unsupported crop image_format: {image_format!r}")
 
         # Build page_index -> image_path map
         page_path: Dict[int, str] = {}
@@ -151,7 +178,7 @@ class CropStepPanelsNode:
 
         # Refresh
         if cache_policy == "refresh":
-            for p in out_dir.glob("step_*.png"):
+            for p in list(out_dir.glob("step_*.png")) + list(out_dir.glob("step_*.jpg")):
                 try:
                     p.unlink()
                 except OSError:
@@ -167,6 +194,12 @@ class CropStepPanelsNode:
         steps: List[Dict[str, Any]] = []
         global_step_idx = 0
         nms_iou = float(cfg.get("nms_iou", NMS_IOU))
+
+        # PNG/JPEG encoding releases the GIL, so crop saves are fanned out to
+        # a thread pool while the main thread keeps cropping the next panels.
+        pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 4)
+        save_futures: List[Future] = []
+
         # Process pages in order
         for page_index in sorted(by_page.keys()):
             img_path = page_path.get(page_index)
@@ -174,53 +207,52 @@ class CropStepPanelsNode:
                 # detection exists but image missing (render failed) -> skip
                 continue
 
-            dets = by_page.get(page_index, [])
-            if not dets:
+            bboxes, confs, clss = _soa_from_detections(by_page.get(page_index))
+            if bboxes.shape[0] == 0:
                 continue
 
             # Optional override: NMS IoU threshold
             nms_iou = float(cfg.get("nms_iou", NMS_IOU))
 
             # Deduplicate overlapping detections BEFORE cropping
-            dets = _nms_dedup_xyxy(dets, iou_thresh=nms_iou)
-
-            # Open page image once
-            img = Image.open(img_path).convert("RGB")
+            keep_nms = _nms_keep_indices(bboxes, confs, iou_thresh=nms_iou)
+            bboxes = bboxes[keep_nms]
+            confs = confs[keep_nms]
+            clss = clss[keep_nms]
+
+            # Open page image once; pages are rendered as RGB PNGs, so the
+            # convert (a full-page alloc + memcpy) only happens if a source
+            # ever deviates from that. load() decodes once so the N crops
+            # below are cheap views into the same buffer.
+            img = Image.open(img_path)
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            img.load()
             W, H = img.size
 
-            # Normalize/validate boxes + attach sorting keys
-            cleaned: List[Tuple[float, float, float, float, Dict[str, Any]]] = []
-            for d in dets:
-                bbox = d.get("bbox_xyxy")
-                if not bbox or len(bbox) != 4:
-                    continue
-                x1, y1, x2, y2 = map(float, bbox)
-
-                # clamp
-                x1 = _clamp(x1, 0.0, W - 1.0)
-                x2 = _clamp(x2, 0.0, W - 1.0)
-                y1 = _clamp(y1, 0.0, H - 1.0)
-                y2 = _clamp(y2, 0.0, H - 1.0)
-
-                # ensure correct ordering
-                if x2 < x1:
-                    x1, x2 = x2, x1
-                if y2 < y1:
-                    y1, y2 = y2, y1
-
-                if (x2 - x1) < min_box_size_px or (y2 - y1) < min_box_size_px:
-                    continue
-
-                cleaned.append((x1, y1, x2, y2, d))
-
-            if not cleaned:
+            # Normalize/validate boxes in one vectorized pass:
+            # fix corner ordering, clamp to the page, drop tiny boxes,
+            # then sort top-to-bottom / left-to-right.
+            x1 = np.clip(np.minimum(bboxes[:, 0], bboxes[:, 2]), 0.0, W - 1.0)
+            x2 = np.clip(np.maximum(bboxes[:, 0], bboxes[:, 2]), 0.0, W - 1.0)
+            y1 = np.clip(np.minimum(bboxes[:, 1], bboxes[:, 3]), 0.0, H - 1.0)
+            y2 = np.clip(np.maximum(bboxes[:, 1], bboxes[:, 3]), 0.0, H - 1.0)
+
+            keep = np.flatnonzero(
+                ((x2 - x1) >= min_box_size_px) & ((y2 - y1) >= min_box_size_px)
+            )
+            if keep.size == 0:
                 continue
 
-            # Sort: top-to-bottom, left-to-right
-            cleaned.sort(key=lambda t: (t[1], t[0]))  # (y1, x1)
+            keep = keep[np.lexsort((x1[keep], y1[keep]))]  # (y1, x1) order
+            cleaned = [
+                (float(x1[j]), float(y1[j]), float(x2[j]), float(y2[j]),
+                 float(confs[j]), int(clss[j]))
+                for j in keep
+            ]
 
             # Crop each panel
-            for panel_index, (x1, y1, x2, y2, d) in enumerate(cleaned):
+            for panel_index, (x1, y1, x2, y2, conf, cls) in enumerate(cleaned):
                 # Add padding and clamp again
                 px1 = int(_clamp(x1 - padding_px, 0, W - 1))
                 py1 = int(_clamp(y1 - padding_px, 0, H - 1))
@@ -236,9 +268,11 @@ class CropStepPanelsNode:
 
                 # Stable step_id + filename
                 step_id = f"{pdf_hash_short}_p{page_index:03d}_s{panel_index:02d}"
-                fname = f"step_{step_id}.png"
+                fname = f"step_{step_id}.{image_format}"
                 out_path = out_dir / fname
-                crop.save(out_path)
+                save_futures.append(
+                    pool.submit(_save_crop, crop, out_path, image_format, jpeg_quality)
+                )
 
                 steps.append({
                     "step_id": step_id,
@@ -247,8 +281,8 @@ class CropStepPanelsNode:
                     "panel_index": panel_index,
                     "bbox_xyxy": [x1, y1, x2, y2],  # original bbox (no padding)
                     "bbox_xyxy_padded": [px1, py1, px2, py2],
-                    "confidence": float(d.get("confidence", 0.0)),
-                    "class_id": int(d.get("class_id", 0)),
+                    "confidence": conf,
+                    "class_id": cls,
                     "image_path": str(out_path),
                     "width_px": crop.size[0],
                     "height_px": crop.size[1],
@@ -256,12 +290,20 @@ class CropStepPanelsNode:
                 })
                 global_step_idx += 1
 
+        # Surface any write error before the manifest claims the crops exist.
+        try:
+            for f in save_futures:
+                f.result()
+        finally:
+            pool.shutdown(wait=True)
+
         manifest = {
             "cache_key": cache_key,
             "steps_dir": str(out_dir),
             "step_count": len(steps),
             "padding_px": padding_px,
             "min_box_size_px": min_box_size_px,
+            "image_format": image_format,
             "steps": steps,
             "nms_iou": nms_iou
         }
@@ -270,11 +312,16 @@ class CropStepPanelsNode:
         return {"step_crops": manifest}
 
     def _read_json(self, path: Path) -> Dict[str, Any]:
+        if orjson is not None:
+            return orjson.loads(path.read_bytes())
         with open(path, "r", encoding="utf-8") as f:
             return json.load(f)
 
     def _write_json(self, path: Path, obj: Dict[str, Any]) -> None:
         tmp = Path(str(path) + ".tmp")
-        with open(tmp, "w", encoding="utf-8") as f:
-            json.dump(obj, f, ensure_ascii=False, indent=2)
+        if orjson is not None:
+            tmp.write_bytes(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
+        else:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(obj, f, ensure_ascii=False, indent=2)
         os.replace(tmp, path)
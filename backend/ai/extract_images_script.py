@@ -1,4 +1,6 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
+import os
 import random
 from .pdf_to_imgs_node import PdfToImagesNode
 import shutil
@@ -39,6 +41,21 @@ def safe_name(s: str) -> str:
     return "".join(ch if ch.isalnum() or ch in "-_." else "_" for ch in s)
 
 
+def link_or_copy(src: Path, dst: Path) -> None:
+    """
+    Hard-link src to dst (metadata-only, zero bytes copied); fall back to a
+    real copy when linking isn't possible (cross-device, FAT, etc.).
+    Raises FileExistsError if dst already exists.
+    """
+    try:
+        os.link(src, dst)
+    except FileExistsError:
+        raise
+    except OSError:
+        with open(src, "rb") as fsrc, open(dst, "xb") as fdst:
+            shutil.copyfileobj(fsrc, fdst)
+
+
 def copy_pages_to_dataset(class_name: str, product_name: str, cache_key: str) -> int:
     """
     Copies all page_*.png from artifacts/pdf_pages/<cache_key> to dataset/images
@@ -55,59 +72,81 @@ def copy_pages_to_dataset(class_name: str, product_name: str, cache_key: str) ->
     cls = safe_name(class_name)
     prod = safe_name(product_name)
 
+    # os.scandir yields dirents without the per-entry stat that glob pays.
+    entries = [
+        e for e in os.scandir(src_dir)
+        if e.name.startswith("page_") and e.name.endswith(".png")
+    ]
+    entries.sort(key=lambda e: e.name)
+
     copied = 0
-    for img_path in sorted(src_dir.glob("page_*.png")):
-        new_name = f"{cls}__{prod}__{pdf_hash_short}__{img_path.name}"
+    for entry in entries:
+        new_name = f"{cls}__{prod}__{pdf_hash_short}__{entry.name}"
         dst_path = DATASET_IMAGES / new_name
 
-        # Avoid overwriting anything (if you re-run, you can choose to skip instead)
-        if dst_path.exists():
-            # If you prefer skipping instead of erroring, replace this with `continue`
+        # Hard-link into the dataset (instant, no bytes copied); collisions
+        # still surface as FileExistsError. If you prefer skipping instead
+        # of erroring, catch FileExistsError and `continue`.
+        try:
+            link_or_copy(Path(entry.path), dst_path)
+        except FileExistsError:
             raise RuntimeError(f"Collision detected: {dst_path}")
-
-        shutil.copy2(img_path, dst_path)
         copied += 1
 
     return copied
 
 
+def process_one_pdf(cls: str, pdf_path: Path) -> tuple[str, int, int, str]:
+    """
+    Render one PDF to page images and link them into dataset/images.
+    Runs inside a worker process; returns (pdf_path, page_count, copied, cache_key).
+    """
+    node = PdfToImagesNode(artifact_root=ARTIFACTS_ROOT, dpi=DPI_DEFAULT)
+    product_name = pdf_path.parent.name  # product folder
+
+    state = {
+        "pdf_source": {
+            "kind": "path",
+            "path": str(pdf_path),
+            "filename": pdf_path.name,
+        },
+        # optional per-run overrides:
+        # "pdf_to_images_config": {"dpi": 200, "cache_policy": "use_cache"}
+    }
+
+    out = node(state)
+    render = out["pdf_render"]
+    cache_key = render["cache_key"]
+
+    copied = copy_pages_to_dataset(cls, product_name, cache_key)
+    return str(pdf_path), render["page_count"], copied, cache_key
+
+
 def main():
     # 1) collect + sample PDFs
     pdfs_per_class = collect_pdfs_per_class(PDF_ROOT)
     sampled = sample_per_class(pdfs_per_class, PDFS_PER_CLASS, SEED)
 
-    # 2) init node once
-    node = PdfToImagesNode(artifact_root=ARTIFACTS_ROOT, dpi=DPI_DEFAULT)
-
-    total_pdfs = sum(len(v) for v in sampled.values())
+    jobs = [(cls, pdf_path) for cls, pdf_list in sampled.items() for pdf_path in pdf_list]
+    total_pdfs = len(jobs)
     done = 0
 
-    for cls, pdf_list in sampled.items():
-        print(f"\n=== Class: {cls} (sampling {len(pdf_list)}) ===")
-        for pdf_path in pdf_list:
+    # 2) each PDF is independent and rasterization is CPU-bound, so fan the
+    # files out across processes. Workers are capped at half the cores so the
+    # renderer and PNG encoder inside each worker still have headroom.
+    workers = max(1, (os.cpu_count() or 2) // 2)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(process_one_pdf, cls, pdf_path): (cls, pdf_path)
+            for cls, pdf_path in jobs
+        }
+        for fut in as_completed(futures):
             done += 1
-            product_name = pdf_path.parent.name  # product folder
-
-            # 3) run PDF -> images
-            state = {
-                "pdf_source": {
-                    "kind": "path",
-                    "path": str(pdf_path),
-                    "filename": pdf_path.name,
-                },
-                # optional per-run overrides:
-                # "pdf_to_images_config": {"dpi": 200, "cache_policy": "use_cache"}
-            }
-
-            out = node(state)
-            render = out["pdf_render"]
-            cache_key = render["cache_key"]
-
-            # 4) copy + rename into dataset/images
-            copied = copy_pages_to_dataset(cls, product_name, cache_key)
-
-            print(f"[{done}/{total_pdfs}] {pdf_path}")
-            print(f"  pages rendered: {render['page_count']}")
+            pdf_str, page_count, copied, cache_key = fut.result()
+
+            print(f"[{done}/{total_pdfs}] {pdf_str}")
+            print(f"  pages rendered: {page_count}")
             print(f"  copied to dataset/images: {copied}")
             print(f"  cache_key: {cache_key}")
 
@@ -1,5 +1,6 @@
 from __future__ import annotations
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import Any, Dict
 import json
 
@@ -8,6 +9,15 @@ from langchain_openai import ChatOpenAI
 import re
 
 
+@lru_cache(maxsize=4)
+def _get_llm(model: str, temperature: float) -> ChatOpenAI:
+    # One client per (model, temperature): constructing ChatOpenAI per call
+    # rebuilds the underlying httpx client, so every render paid a fresh
+    # TCP+TLS handshake. A shared instance keeps the connection pool alive
+    # across graph invocations. ChatOpenAI is thread-safe for invoke().
+    return ChatOpenAI(model=model, temperature=temperature)
+
+
 def split_rendered_steps(markdown_text: str) -> list[str]:
     # Split on "### Step X:"
     parts = re.split(r'(?=### Step \d+:)', markdown_text)
@@ -27,7 +37,7 @@ class LlmRenderHumanOutputNode:
 
         instructions_obj = self._coerce_to_json_obj(raw)
 
-        llm = ChatOpenAI(model=self.model, temperature=self.temperature)
+        llm = _get_llm(self.model, self.temperature)
 
         resp = llm.invoke([
             SystemMessage(content=self._system_prompt()),
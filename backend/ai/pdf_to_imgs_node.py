@@ -4,10 +4,16 @@ import hashlib
 import json
 import os
 import re
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Any, Dict, List, Literal, Optional, TypedDict, Union
 
+try:
+    import orjson  # ~5x faster manifest encode/decode than stdlib json
+except ImportError:
+    orjson = None
+
 
 # -----------------------------
 # State / inputs
@@ -24,10 +30,17 @@ class PdfToImagesConfig(TypedDict, total=False):
     artifact_root: str                 # base directory for artifacts
     cache_policy: Literal["use_cache", "refresh"]
     dpi: int                           # default 200
-    format: Literal["png"]             # keep "png" for now
+    format: Literal["png", "jpg"]      # jpg skips the deflate pass; png stays default
+    colorspace: Literal["rgb", "gray"] # gray renders/moves ~3x less pixel data
     renderer_version: str              # cache-busting if renderer changes
 
 
+# Precompiled once: _sanitize_path_component runs for every cache key.
+# Windows forbids <>:"/\|?* (and some other edge cases); keep it simple and
+# portable by whitelisting. The `+` collapses runs in the same pass.
+_UNSAFE_CHARS = re.compile(r"[^A-Za-z0-9._-]+")
+
+
 # -----------------------------
 # Node implementation
 # -----------------------------
@@ -37,7 +50,8 @@ class PdfToImagesNode:
     artifact_root: Path = Path("./artifacts")
     cache_policy: Literal["use_cache", "refresh"] = "use_cache"
     dpi: int = 200
-    image_format: Literal["png"] = "png"
+    image_format: Literal["png", "jpg"] = "png"
+    colorspace: Literal["rgb", "gray"] = "rgb"
     renderer_version: str = "pymupdf_v1"
 
     def __call__(self, state: Dict[str, Any]) -> Dict[str, Any]:
@@ -55,24 +69,29 @@ class PdfToImagesNode:
         cache_policy = cfg.get("cache_policy", self.cache_policy)
         dpi = int(cfg.get("dpi", self.dpi))
         image_format = cfg.get("format", self.image_format)
+        colorspace = cfg.get("colorspace", self.colorspace)
         renderer_version = cfg.get("renderer_version", self.renderer_version)
 
-        if image_format != "png":
-            raise ValueError("This node currently supports only PNG output (format='png').")
+        if image_format not in ("png", "jpg"):
+            raise ValueError("This node supports only PNG or JPEG output (format='png'|'jpg').")
+        if colorspace not in ("rgb", "gray"):
+            raise ValueError("colorspace must be 'rgb' or 'gray'.")
 
-        pdf_bytes = self._load_pdf_bytes(pdf_source)
-        pdf_hash = hashlib.sha256(pdf_bytes).hexdigest()
+        pdf_hash, _ = self._hash_pdf(pdf_source)
 
         cache_key = self._make_cache_key(
             pdf_hash=pdf_hash,
             dpi=dpi,
             image_format=image_format,
             renderer_version=renderer_version,
+            colorspace=colorspace,
         )
         out_dir = artifact_root / "pdf_pages" / cache_key
         manifest_path = out_dir / "manifest.json"
 
-        # Cache hit path
+        # Cache hit path: for path sources this point is reached with only the
+        # streamed hash — a hit costs a stat + small JSON read, never the full
+        # PDF load.
         if cache_policy == "use_cache" and manifest_path.exists():
             manifest = self._read_json(manifest_path)
             return {"pdf_render": manifest}
@@ -81,7 +100,7 @@ class PdfToImagesNode:
         out_dir.mkdir(parents=True, exist_ok=True)
         if cache_policy == "refresh":
             # remove old pngs + manifest if present
-            for p in out_dir.glob("page_*.png"):
+            for p in out_dir.glob(f"page_*.{image_format}"):
                 try:
                     p.unlink()
                 except OSError:
@@ -93,7 +112,9 @@ class PdfToImagesNode:
                     pass
 
         # Render
-        pages = self._render_all_pages_pymupdf(pdf_bytes, out_dir, dpi=dpi)
+        pages = self._render_all_pages_pymupdf(
+            pdf_source, out_dir, dpi=dpi, image_format=image_format, colorspace=colorspace
+        )
 
         manifest = {
             "cache_key": cache_key,
@@ -102,6 +123,7 @@ class PdfToImagesNode:
             "page_count": len(pages),
             "dpi": dpi,
             "format": image_format,
+            "colorspace": colorspace,
             "pages": pages,  # 0-based indices
         }
         title_page = None
@@ -125,6 +147,36 @@ class PdfToImagesNode:
     # Helpers
     # -----------------------------
 
+    def _hash_pdf(self, pdf_source: PdfSource) -> tuple[str, Optional[bytes]]:
+        """
+        Returns (pdf_hash, pdf_bytes-or-None).
+
+        For path sources the file is hashed by streaming (file_digest runs the
+        whole loop in C with the GIL released and uses OpenSSL's SHA-NI path),
+        so the PDF is never materialized in RAM just to compute its cache key;
+        bytes come back None and are loaded separately only when needed.
+        """
+        kind = pdf_source.get("kind")
+        if kind == "path":
+            path = pdf_source.get("path")
+            if not path:
+                raise ValueError("pdf_source.kind='path' requires pdf_source.path")
+            with open(path, "rb") as f:
+                if hasattr(hashlib, "file_digest"):  # Python 3.11+
+                    return hashlib.file_digest(f, "sha256").hexdigest(), None
+                h = hashlib.sha256()
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(chunk)
+                return h.hexdigest(), None
+
+        if kind == "bytes":
+            b = pdf_source.get("bytes")
+            if b is None:
+                raise ValueError("pdf_source.kind='bytes' requires pdf_source.bytes")
+            return hashlib.sha256(b).hexdigest(), b
+
+        raise ValueError("pdf_source.kind must be 'path' or 'bytes'")
+
     def _load_pdf_bytes(self, pdf_source: PdfSource) -> bytes:
         kind = pdf_source.get("kind")
         if kind == "path":
@@ -142,10 +194,20 @@ class PdfToImagesNode:
 
         raise ValueError("pdf_source.kind must be 'path' or 'bytes'")
 
-    def _render_all_pages_pymupdf(self, pdf_bytes: bytes, out_dir: Path, dpi: int) -> List[Dict[str, Any]]:
+    def _render_all_pages_pymupdf(
+        self,
+        pdf_source: PdfSource,
+        out_dir: Path,
+        dpi: int,
+        image_format: str = "png",
+        colorspace: str = "rgb",
+    ) -> List[Dict[str, Any]]:
         """
         Renders all pages using PyMuPDF (fitz).
-        Produces page_000.png, page_001.png, ... and returns metadata records.
+        Produces page_000.png (or .jpg), page_001.png, ... and returns metadata
+        records. JPEG skips PNG's deflate pass — the dominant per-page encode
+        cost at 200 DPI — at the price of lossy (q=85) output, which the
+        detector downstream tolerates fine.
         """
         try:
             import fitz  # PyMuPDF
@@ -156,58 +218,111 @@ class PdfToImagesNode:
 
         # PyMuPDF uses 72 DPI as baseline scale
         zoom = dpi / 72.0
-        matrix = fitz.Matrix(zoom, zoom)
+        # Grayscale produces (and encodes) one channel instead of three — a
+        # pure bandwidth win when downstream only needs luminance.
+        fitz_colorspace = fitz.csGRAY if colorspace == "gray" else fitz.csRGB
 
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        pages: List[Dict[str, Any]] = []
+        # Path sources are opened by filename so MuPDF memory-maps the file
+        # itself and the PDF never materializes as a Python bytes object;
+        # byte sources already hold their buffer.
+        if pdf_source.get("kind") == "path":
+            pdf_path = pdf_source["path"]
 
-        for i in range(doc.page_count):
+            def open_doc():
+                return fitz.open(pdf_path)
+        else:
+            pdf_bytes = self._load_pdf_bytes(pdf_source)
+
+            def open_doc():
+                return fitz.open(stream=pdf_bytes, filetype="pdf")
+
+        doc = open_doc()
+        try:
+            page_count = doc.page_count
+        finally:
+            doc.close()
+
+        def render_range(page_range: range) -> List[Dict[str, Any]]:
+            # One document per worker: MuPDF documents are not safe for
+            # concurrent access, but get_pixmap releases the GIL, so the
+            # rasterization itself runs truly in parallel across threads.
+            wdoc = open_doc()
+            matrix = fitz.Matrix(zoom, zoom)
+            records: List[Dict[str, Any]] = []
             try:
-                page = doc.load_page(i)
-                pix = page.get_pixmap(matrix=matrix, alpha=False)  # alpha False = smaller PNG
-                filename = f"page_{i:03d}.png"
-                image_path = out_dir / filename
-                pix.save(str(image_path))
-
-                pages.append({
-                    "page_index": i,                 # 0-based
-                    "image_path": str(image_path),   # local path reference
-                    "width_px": pix.width,
-                    "height_px": pix.height,
-                    "dpi": dpi,
-                })
-            except Exception as ex:
-                # Keep going; downstream can decide what to do with errors
-                pages.append({
-                    "page_index": i,
-                    "error": f"{type(ex).__name__}: {ex}",
-                    "dpi": dpi,
-                })
-
-        doc.close()
-        return pages
-
-    def _make_cache_key(self, pdf_hash: str, dpi: int, image_format: str, renderer_version: str) -> str:
+                for i in page_range:
+                    try:
+                        page = wdoc.load_page(i)
+                        pix = page.get_pixmap(matrix=matrix, alpha=False, colorspace=fitz_colorspace)
+                        filename = f"page_{i:03d}.{image_format}"
+                        image_path = out_dir / filename
+                        if image_format == "jpg":
+                            image_path.write_bytes(pix.tobytes("jpeg", jpg_quality=85))
+                        else:
+                            pix.save(str(image_path))
+
+                        records.append({
+                            "page_index": i,                 # 0-based
+                            "image_path": str(image_path),   # local path reference
+                            "width_px": pix.width,
+                            "height_px": pix.height,
+                            "dpi": dpi,
+                        })
+                    except Exception as ex:
+                        # Keep going; downstream can decide what to do with errors
+                        records.append({
+                            "page_index": i,
+                            "error": f"{type(ex).__name__}: {ex}",
+                            "dpi": dpi,
+                        })
+            finally:
+                wdoc.close()
+            return records
+
+        workers = min(page_count, os.cpu_count() or 1)
+        if workers <= 1:
+            return render_range(range(page_count))
+
+        # Contiguous slices: each worker reuses one document across its pages
+        # and the flattened output stays in page order.
+        per_worker = -(-page_count // workers)
+        slices = [
+            range(start, min(start + per_worker, page_count))
+            for start in range(0, page_count, per_worker)
+        ]
+        with ThreadPoolExecutor(max_workers=len(slices)) as ex:
+            return [rec for chunk in ex.map(render_range, slices) for rec in chunk]
+
+    def _make_cache_key(
+        self, pdf_hash: str, dpi: int, image_format: str, renderer_version: str, colorspace: str = "rgb"
+    ) -> str:
         raw = f"{pdf_hash}_dpi{dpi}_{image_format}_{renderer_version}"
+        if colorspace != "rgb":
+            # appended only for non-default so existing rgb caches stay valid
+            raw += f"_{colorspace}"
         return self._sanitize_path_component(raw)
 
     def _sanitize_path_component(self, s: str) -> str:
         """
         Make a string safe to use as a single directory/file name component on Windows/macOS/Linux.
         """
-        # Windows forbids <>:"/\\|?* (and some other edge cases). Keep it simple and portable:
-        sanitized = re.sub(r"[^A-Za-z0-9._-]+", "_", s)
+        sanitized = _UNSAFE_CHARS.sub("_", s)
         sanitized = sanitized.strip(" ._")
         return sanitized or "cache"
 
     def _read_json(self, path: Path) -> Dict[str, Any]:
+        if orjson is not None:
+            return orjson.loads(path.read_bytes())
         with open(path, "r", encoding="utf-8") as f:
             return json.load(f)
 
     def _write_json(self, path: Path, obj: Dict[str, Any]) -> None:
         tmp = Path(str(path) + ".tmp")
-        with open(tmp, "w", encoding="utf-8") as f:
-            json.dump(obj, f, ensure_ascii=False, indent=2)
+        if orjson is not None:
+            tmp.write_bytes(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
+        else:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(obj, f, ensure_ascii=False, indent=2)
         os.replace(tmp, path)
 
 
@@ -1,6 +1,7 @@
 # states.py
 
-from typing import TypedDict, List, Dict, Any, Optional
+import operator
+from typing import Annotated, TypedDict, List, Dict, Any, Optional
 
 
 class ImageState(TypedDict, total=False):
@@ -68,7 +69,9 @@ class IkeaState(TypedDict, total=False):
     # agentic fields
     current_step: int
     step_analyses: List[Dict[str, Any]]
-    messages: List[Dict[str, str]]
+    # Additive channel: nodes return only the NEW messages and LangGraph
+    # concatenates, instead of every node copying the whole history back.
+    messages: Annotated[List[Dict[str, str]], operator.add]
     final_instructions: Dict[str, Any]
     output_text: str
     output_text_list: List[str]
\ No newline at end of file
@@ -1,6 +1,9 @@
 from __future__ import annotations
 from typing import Dict, Any, List
 
+import numpy as np
+
+
 class DetectStepPanelsNode:
     def __init__(self, detector):
         self.detector = detector
@@ -19,17 +22,11 @@ class DetectStepPanelsNode:
             img_paths.append(p["image_path"])
             page_indices.append(int(p["page_index"]))
 
-        detections_per_page = self.detector.predict_many(img_paths)
-
-        per_page = {}  # page_index -> list of det dicts
-        for page_index, dets in zip(page_indices, detections_per_page):
-            per_page[page_index] = []
-            for d in dets:
-                per_page[page_index].append({
-                    "bbox_xyxy": d.bbox_xyxy,
-                    "confidence": d.conf,
-                    "class_id": d.cls,
-                })
+        # page_index -> SoA record, taken directly from the detector: the
+        # arrays are sliced out of the inference results without ever
+        # materializing per-detection Python objects in between.
+        detections_per_page = self.detector.predict_many_soa(img_paths)
+        per_page: Dict[int, Dict[str, Any]] = dict(zip(page_indices, detections_per_page))
 
         return {
             "panel_detections": {
@@ -28,13 +28,39 @@ class StepPanelDetector:
         conf: float = 0.25,
         iou: float = 0.7,
         device: Optional[Union[str, int]] = None,  # "cuda:0", 0, "cpu"
+        batch: int = 16,
+        compile_model: bool = False,
     ):
         self.weights_path = str(weights_path)
         self.conf = conf
         self.iou = iou
         self.device = device
+        self.batch = batch
         self.model = YOLO(self.weights_path)
 
+        # FP16 roughly doubles throughput and halves VRAM on Tensor-Core
+        # GPUs (capability >= 7, Volta/Turing+) with negligible mAP loss for
+        # detection; half=True is invalid on CPU, so gate it on capability.
+        self._half = False
+        if self.device not in (None, "cpu"):
+            try:
+                import torch
+                if torch.cuda.is_available() and torch.cuda.get_device_capability(self.device)[0] >= 7:
+                    self._half = True
+            except Exception:
+                self._half = False
+
+        # Opt-in: torch.compile fuses kernels and cuts per-layer launch
+        # overhead, which pays off when one detector instance serves many
+        # pages per PDF. Off by default because the first call compiles
+        # (tens of seconds) — wrong trade for one-shot scripts.
+        if compile_model:
+            try:
+                import torch
+                self.model.model = torch.compile(self.model.model, mode="reduce-overhead")
+            except Exception:
+                pass  # keep the eager model; compile is purely an optimization
+
     def predict_image(self, image_path: Union[str, Path]) -> List[Detection]:
         """
         Returns a list of detections for a single image.
@@ -44,6 +70,7 @@ class StepPanelDetector:
             conf=self.conf,
             iou=self.iou,
             device=self.device,
+            half=self._half,
             verbose=False,
         )
 
@@ -54,16 +81,16 @@ class StepPanelDetector:
         if r.boxes is None or len(r.boxes) == 0:
             return dets
 
-        xyxy = r.boxes.xyxy.cpu().numpy()   # (N,4)
-        confs = r.boxes.conf.cpu().numpy()  # (N,)
-        clss = r.boxes.cls.cpu().numpy()    # (N,)
+        # One device->host transfer: boxes.data is (N, 6) [x1,y1,x2,y2,conf,cls],
+        # vs three separate .cpu() syncs for xyxy/conf/cls.
+        data = r.boxes.data.cpu().numpy()
 
-        for i in range(xyxy.shape[0]):
+        for row in data:
             dets.append(
                 Detection(
-                    bbox_xyxy=xyxy[i].tolist(),
-                    conf=float(confs[i]),
-                    cls=int(clss[i]),
+                    bbox_xyxy=row[:4].tolist(),
+                    conf=float(row[4]),
+                    cls=int(row[5]),
                 )
             )
 
@@ -74,12 +101,16 @@ class StepPanelDetector:
         Batch predict (still fine if you pass many images).
         Returns list-of-detections per image, aligned with input order.
         """
-        # Ultralytics can take a list of paths
+        # Ultralytics can take a list of paths; batch= makes it run real
+        # (batch, 3, H, W) forward passes instead of one launch per page,
+        # which is where the time goes for a small model on many pages.
         results = self.model.predict(
             source=[str(p) for p in image_paths],
             conf=self.conf,
             iou=self.iou,
             device=self.device,
+            batch=self.batch,
+            half=self._half,
             verbose=False,
         )
 
@@ -87,21 +118,57 @@ class StepPanelDetector:
         for r in results:
             dets: List[Detection] = []
             if r.boxes is not None and len(r.boxes) > 0:
-                xyxy = r.boxes.xyxy.cpu().numpy()
-                confs = r.boxes.conf.cpu().numpy()
-                clss = r.boxes.cls.cpu().numpy()
-                for i in range(xyxy.shape[0]):
+                # One device->host transfer per image instead of three syncs.
+                data = r.boxes.data.cpu().numpy()
+                for row in data:
                     dets.append(
                         Detection(
-                            bbox_xyxy=xyxy[i].tolist(),
-                            conf=float(confs[i]),
-                            cls=int(clss[i]),
+                            bbox_xyxy=row[:4].tolist(),
+                            conf=float(row[4]),
+                            cls=int(row[5]),
                         )
                     )
             all_out.append(dets)
 
         return all_out
 
+    def predict_many_soa(self, image_paths: List[Union[str, Path]]) -> List[Dict[str, np.ndarray]]:
+        """
+        Like predict_many, but returns one SoA record per image:
+          {"bbox_xyxy": (N,4) float32, "confidence": (N,) float32, "class_id": (N,) int64}
+
+        No per-detection Python objects are built — the arrays are sliced
+        straight out of the single (N,6) result transfer, and downstream
+        nodes (detect/crop) consume exactly this layout.
+        """
+        results = self.model.predict(
+            source=[str(p) for p in image_paths],
+            conf=self.conf,
+            iou=self.iou,
+            device=self.device,
+            batch=self.batch,
+            half=self._half,
+            verbose=False,
+        )
+
+        out: List[Dict[str, np.ndarray]] = []
+        for r in results:
+            if r.boxes is None or len(r.boxes) == 0:
+                out.append({
+                    "bbox_xyxy": np.zeros((0, 4), dtype=np.float32),
+                    "confidence": np.zeros((0,), dtype=np.float32),
+                    "class_id": np.zeros((0,), dtype=np.int64),
+                })
+                continue
+
+            data = r.boxes.data.cpu().numpy()
+            out.append({
+                "bbox_xyxy": data[:, :4].astype(np.float32, copy=False),
+                "confidence": data[:, 4].astype(np.float32, copy=False),
+                "class_id": data[:, 5].astype(np.int64),
+            })
+        return out
+
 
 if __name__ == "__main__":
     weights = r"C:\Windows\System32\runs\detect\train\weights\best.pt"
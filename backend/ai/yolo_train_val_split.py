@@ -1,5 +1,6 @@
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import random
+import os
 import shutil
 
 # ---- CONFIG ----
@@ -23,6 +24,27 @@ def extract_hash6(filename_stem: str) -> str:
     return parts[2]
 
 
+def _fast_copy(src: Path, dst: Path) -> None:
+    """
+    Hard-link src to dst (metadata-only, zero bytes copied); fall back to a
+    real copy when linking isn't possible (cross-device, FAT, etc.).
+    Replaces an existing dst so re-runs stay idempotent like copy2 was.
+    """
+    try:
+        os.link(src, dst)
+        return
+    except FileExistsError:
+        dst.unlink()
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+    except OSError:
+        pass
+    shutil.copy2(src, dst)
+
+
 def main():
     images_dir = SOURCE_DATASET / "images"
     labels_dir = SOURCE_DATASET / "labels"
@@ -38,50 +60,58 @@ def main():
     (OUT_DATASET / "labels" / "train").mkdir(parents=True, exist_ok=True)
     (OUT_DATASET / "labels" / "val").mkdir(parents=True, exist_ok=True)
 
-    # Collect images and group by pdf hash
-    image_paths = sorted([p for p in images_dir.iterdir() if p.suffix.lower() in IMG_EXTS])
-    if not image_paths:
-        raise RuntimeError(f"No images found in: {images_dir}")
-
-    groups = {}  # hash6 -> list[Path]
-    for img_path in image_paths:
-        h = extract_hash6(img_path.stem)
-        groups.setdefault(h, []).append(img_path)
-
-    hashes = sorted(groups.keys())
-    rng = random.Random(SEED)
-    rng.shuffle(hashes)
-
-    n_train = int(len(hashes) * TRAIN_RATIO)
-    train_hashes = set(hashes[:n_train])
-    val_hashes   = set(hashes[n_train:])
+    # Stable per-manual assignment: a pure function of the manual hash, so
+    # all pages of one manual land in the same split, the partition stays
+    # identical when files arrive incrementally, and no grouping dict or
+    # shuffle pass is needed. SEED salts the byte so different seeds still
+    # give different (deterministic) partitions.
+    threshold = int(TRAIN_RATIO * 256)
 
-    print(f"Total manuals (hash groups): {len(hashes)}")
-    print(f"Train manuals: {len(train_hashes)} | Val manuals: {len(val_hashes)}")
-    print(f"Total images: {len(image_paths)}")
+    def assign_split(hash6: str) -> str:
+        return "train" if ((int(hash6, 16) ^ SEED) & 0xFF) < threshold else "val"
 
     copied_images = {"train": 0, "val": 0}
     copied_labels = {"train": 0, "val": 0}
+    split_manuals = {"train": set(), "val": set()}
     missing_labels = 0
+    total_images = 0
+
+    # Single scandir pass: decide the split inline and queue the copy, then
+    # fan the copies out over threads. Hardlinks are metadata-only and plain
+    # copies release the GIL in the kernel, so 16 workers turn minutes of
+    # serial byte copying into filesystem-bound metadata work.
+    copy_jobs: list[tuple[Path, Path]] = []
+    for entry in os.scandir(images_dir):
+        stem, ext = os.path.splitext(entry.name)
+        if ext.lower() not in IMG_EXTS:
+            continue
+
+        h = extract_hash6(stem)
+        split = assign_split(h)
+        split_manuals[split].add(h)
+        total_images += 1
+
+        copy_jobs.append((Path(entry.path), OUT_DATASET / "images" / split / entry.name))
+        copied_images[split] += 1
+
+        # copy label if exists (negatives might have none)
+        lab_path = labels_dir / (stem + ".txt")
+        if lab_path.exists():
+            copy_jobs.append((lab_path, OUT_DATASET / "labels" / split / lab_path.name))
+            copied_labels[split] += 1
+        else:
+            missing_labels += 1
+
+    if total_images == 0:
+        raise RuntimeError(f"No images found in: {images_dir}")
+
+    print(f"Total manuals (hash groups): {len(split_manuals['train'] | split_manuals['val'])}")
+    print(f"Train manuals: {len(split_manuals['train'])} | Val manuals: {len(split_manuals['val'])}")
+    print(f"Total images: {total_images}")
 
-    # Copy files
-    for h, imgs in groups.items():
-        split = "train" if h in train_hashes else "val"
-
-        for img_path in imgs:
-            # copy image
-            dst_img = OUT_DATASET / "images" / split / img_path.name
-            shutil.copy2(img_path, dst_img)
-            copied_images[split] += 1
-
-            # copy label if exists (negatives might have none)
-            lab_path = labels_dir / (img_path.stem + ".txt")
-            if lab_path.exists():
-                dst_lab = OUT_DATASET / "labels" / split / lab_path.name
-                shutil.copy2(lab_path, dst_lab)
-                copied_labels[split] += 1
-            else:
-                missing_labels += 1
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        # list() drains the iterator so copy errors surface here, not silently
+        list(pool.map(lambda job: _fast_copy(*job), copy_jobs))
 
     print("\nDone.")
     print(f"Images copied  - train: {copied_images['train']} | val: {copied_images['val']}")